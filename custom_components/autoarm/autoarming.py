@@ -2,11 +2,16 @@ import asyncio
 import datetime
 import logging
 import time
+from collections import deque
+from dataclasses import dataclass
 from functools import partial
 
 import homeassistant.util.dt as dt_util
 from homeassistant.components.sun import STATE_BELOW_HORIZON
 from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    CONF_SERVICE,
+    CONF_TIMEOUT,
     EVENT_HOMEASSISTANT_STOP,
     STATE_ALARM_ARMED_AWAY,
     STATE_ALARM_ARMED_CUSTOM_BYPASS,
@@ -21,30 +26,31 @@ from homeassistant.const import (
     STATE_HOME,
     EVENT_HOMEASSISTANT_START,
 )
-from homeassistant.core import Event, HomeAssistant, callback
-from homeassistant.helpers.event import (
-    EventStateChangedData,
-    async_track_point_in_time,
-    async_track_state_change_event,
-    async_track_sunrise,
-    async_track_sunset,
-    async_track_utc_time_change,
-)
+from homeassistant.core import Event, HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.helpers.event import EventStateChangedData, async_track_state_change_event
 from homeassistant.helpers.typing import ConfigType, EventType
 
+from .clock import Clock
 from .const import (
     CONF_ACTIONS,
     CONF_ALARM_PANEL,
     CONF_ARM_AWAY_DELAY,
+    CONF_ARM_RETRIES,
+    CONF_ARM_TIMEOUT,
+    CONF_ARM_VIA_SERVICE,
     CONF_AUTO_ARM,
     CONF_BUTTON_ENTITY_AWAY,
     CONF_BUTTON_ENTITY_DISARM,
     CONF_BUTTON_ENTITY_RESET,
+    CONF_DATA,
     CONF_NOTIFY,
     CONF_OCCUPANTS,
+    CONF_RESTORE_FROM_RECORDER,
+    CONF_SHADOW,
     CONF_SLEEP_END,
     CONF_SLEEP_START,
     CONF_SUNRISE_CUTOFF,
+    CONF_TARGETS,
     CONF_THROTTLE_CALLS,
     CONF_THROTTLE_SECONDS,
     CONFIG_SCHEMA,
@@ -70,7 +76,85 @@ def total_secs(t: time) -> int:
 OVERRIDE_STATES = (STATE_ALARM_ARMED_AWAY, STATE_ALARM_ARMED_VACATION, STATE_ALARM_ARMED_CUSTOM_BYPASS)
 EPHEMERAL_STATES = (STATE_ALARM_PENDING, STATE_ALARM_ARMING, STATE_ALARM_DISARMING, STATE_ALARM_TRIGGERED)
 ZOMBIE_STATES = ("unknown", "unavailable")
+TRANSITION_STATES = (STATE_ALARM_PENDING, STATE_ALARM_ARMING, STATE_ALARM_DISARMING)
 NS_MOBILE_ACTIONS = "mobile_actions"
+PANEL_SERVICES = {
+    STATE_ALARM_ARMED_AWAY: "alarm_arm_away",
+    STATE_ALARM_ARMED_HOME: "alarm_arm_home",
+    STATE_ALARM_ARMED_NIGHT: "alarm_arm_night",
+    STATE_ALARM_ARMED_VACATION: "alarm_arm_vacation",
+    STATE_ALARM_ARMED_CUSTOM_BYPASS: "alarm_arm_custom_bypass",
+    STATE_ALARM_DISARMED: "alarm_disarm",
+}
+RESTORE_TTL = 900
+RECONCILE_MIN_INTERVAL = 30
+RECONCILE_MAX_INTERVAL = 900
+NOTIFY_TIMEOUT = 10
+NOTIFY_BREAKER_FAILURES = 3
+NOTIFY_BREAKER_COOLDOWN = 300
+SHADOW_BUFFER_SIZE = 50
+SHADOW_BUDGET_SECS = 0.0002
+SERVICE_SHADOW_REPORT = "shadow_report"
+
+
+def is_zombie(state: str) -> bool:
+    """Missing state is treated as a zombie, as well as unknown and unavailable"""
+    return state is None or state in ZOMBIE_STATES
+
+
+@dataclass(slots=True)
+class StateChange:
+    entity_id: str = None
+    old: str = None
+    new: str = None
+
+
+def profile_targets(profile: dict) -> list:
+    """Notification targets for a profile, as a list of services or target dicts"""
+    if profile.get(CONF_TARGETS):
+        return profile[CONF_TARGETS]
+    if profile.get(CONF_SERVICE):
+        return [profile[CONF_SERVICE]]
+    return []
+
+
+def awake_at(now: datetime.time, sleep_start: datetime.time, sleep_end: datetime.time, night: bool) -> bool:
+    """Waking hours by configured sleep times, or by the sun if no sleep times configured"""
+    if sleep_start and sleep_end:
+        return sleep_end <= now <= sleep_start
+    return not night
+
+
+def decide_armed_state(
+    existing_state: str,
+    occupied: bool,
+    awake: bool,
+    auto_disarm: bool = True,
+    force_arm: bool = True,
+    hint_arming: str = None,
+) -> tuple[str, str]:
+    """Pure decision logic for resetting the armed state, free of any Home Assistant access
+
+    Returns the state to arm to, or None to leave the existing state alone, and the reason why
+    """
+    if existing_state == STATE_ALARM_DISARMED and not force_arm:
+        return None, "Ignoring unforced reset for disarmed"
+    if existing_state in OVERRIDE_STATES:
+        return None, "Ignoring reset for existing state"
+
+    if occupied:
+        if auto_disarm and awake and not force_arm:
+            return STATE_ALARM_DISARMED, "Disarming for occupied during waking hours"
+        elif not awake:
+            return STATE_ALARM_ARMED_NIGHT, "Arming for occupied out of waking hours"
+        elif hint_arming:
+            return hint_arming, "Using hinted arming state"
+        else:
+            return STATE_ALARM_ARMED_HOME, "Defaulting to armed home"
+
+    if hint_arming:
+        return hint_arming, "Using hinted arming state"
+    return STATE_ALARM_ARMED_AWAY, "Defaulting to armed away"
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
@@ -94,6 +178,9 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
             CONF_NOTIFY: config.get(CONF_NOTIFY, {}),
             CONF_THROTTLE_SECONDS: config.get(CONF_THROTTLE_SECONDS, 60),
             CONF_THROTTLE_CALLS: config.get(CONF_THROTTLE_CALLS, 6),
+            CONF_ARM_VIA_SERVICE: config.get(CONF_ARM_VIA_SERVICE, False),
+            CONF_RESTORE_FROM_RECORDER: config.get(CONF_RESTORE_FROM_RECORDER, False),
+            CONF_SHADOW: config.get(CONF_SHADOW),
         },
     )
 
@@ -112,7 +199,12 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         actions=config[CONF_ACTIONS],
         notify=config[CONF_NOTIFY],
         throttle_calls=config.get(CONF_THROTTLE_CALLS, 6),
-        throttle_seconds=config.get(CONF_THROTTLE_SECONDS, 60)
+        throttle_seconds=config.get(CONF_THROTTLE_SECONDS, 60),
+        arm_via_service=config.get(CONF_ARM_VIA_SERVICE, False),
+        arm_timeout=config.get(CONF_ARM_TIMEOUT, 10),
+        arm_retries=config.get(CONF_ARM_RETRIES, 2),
+        restore_from_recorder=config.get(CONF_RESTORE_FROM_RECORDER, False),
+        shadow=config.get(CONF_SHADOW),
     )
     await armer.initialize()
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, armer.async_shutdown)
@@ -121,6 +213,42 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 
 
 class AlarmArmer:
+    __slots__ = (
+        "hass",
+        "clock",
+        "alarm_panel",
+        "auto_disarm",
+        "sleep_start",
+        "sleep_end",
+        "sunrise_cutoff",
+        "arm_away_delay",
+        "reset_button",
+        "away_button",
+        "disarm_button",
+        "occupants",
+        "actions",
+        "notify_profiles",
+        "notify_breakers",
+        "unsubscribes",
+        "last_request",
+        "button_device",
+        "arming_in_progress",
+        "arming_lock",
+        "arm_requests",
+        "decision_fingerprint",
+        "reconcile_interval",
+        "reconcile_unsub",
+        "shut_down",
+        "rate_limiter",
+        "arm_via_service",
+        "arm_timeout",
+        "arm_retries",
+        "panel_confirmation",
+        "panel_command_stats",
+        "restore_from_recorder",
+        "restored_states",
+        "shadow",
+    )
 
     def __init__(
         self,
@@ -138,9 +266,16 @@ class AlarmArmer:
         actions: list = None,
         notify: dict = None,
         throttle_calls: int = 6,
-        throttle_seconds: int = 60
+        throttle_seconds: int = 60,
+        arm_via_service: bool = False,
+        arm_timeout: float = 10,
+        arm_retries: int = 2,
+        restore_from_recorder: bool = False,
+        shadow: dict = None,
+        clock: Clock = None,
     ):
         self.hass: HomeAssistant = hass
+        self.clock: Clock = clock or Clock(hass)
         self.alarm_panel: str = alarm_panel
         self.auto_disarm: bool = auto_disarm
         self.sleep_start: time = sleep_start
@@ -153,12 +288,37 @@ class AlarmArmer:
         self.occupants: list[str] = occupants or []
         self.actions: list[str] = actions or []
         self.notify_profiles: dict[str, dict] = notify or {}
+        self.notify_breakers: dict[str, CircuitBreaker] = {}
         self.unsubscribes: list[callback] = []
         self.last_request: time = None
         self.button_device: dict[str, str] = {}
         self.arming_in_progress: asyncio.Event = asyncio.Event()
+        self.arming_lock: asyncio.Lock = asyncio.Lock()
+        self.arm_requests: int = 0
+        self.decision_fingerprint: tuple = None
+        self.reconcile_interval: int = RECONCILE_MIN_INTERVAL
+        self.reconcile_unsub: callback = None
+        self.shut_down: bool = False
         self.rate_limiter: Limiter = Limiter(window=throttle_seconds, 
-                                             max_calls=throttle_calls)
+                                             max_calls=throttle_calls,
+                                             clock=self.clock)
+        self.arm_via_service: bool = arm_via_service
+        self.arm_timeout: float = arm_timeout
+        self.arm_retries: int = arm_retries
+        self.panel_confirmation: tuple[str, asyncio.Future] = None
+        self.panel_command_stats: dict = {"commands": 0, "confirmed": 0, "timeouts": 0, "last_latency": None}
+        self.restore_from_recorder: bool = restore_from_recorder
+        self.restored_states: dict[str, str] = {}
+        self.shadow: ShadowEvaluator = None
+        if shadow is not None:
+            self.shadow = ShadowEvaluator(
+                self.clock,
+                auto_disarm=shadow.get(CONF_AUTO_ARM, auto_disarm),
+                sleep_start=shadow.get(CONF_SLEEP_START, sleep_start),
+                sleep_end=shadow.get(CONF_SLEEP_END, sleep_end),
+            )
+            if bool(self.shadow.sleep_start) != bool(self.shadow.sleep_end):
+                _LOGGER.warning("AUTOARM Shadow needs both sleep_start and sleep_end, waking hours will follow the sun")
 
     async def initialize(self):
         _LOGGER.debug("AUTOARM Initializing ...")
@@ -176,13 +336,22 @@ class AlarmArmer:
         self.initialize_occupancy()
         self.initialize_bedtime()
         self.initialize_buttons()
+        if self.restore_from_recorder:
+            await self.restore_states()
         await self.reset_armed_state(force_arm=False)
         self.initialize_integration()
+        self.schedule_reconcile()
         _LOGGER.info("AUTOARM Initialized, state: %s", self.armed_state())
 
     def initialize_integration(self) -> None:
         self.unsubscribes.append(self.hass.bus.async_listen("mobile_app_notification_action", self.on_mobile_action))
         self.unsubscribes.append(self.hass.bus.async_listen(EVENT_HOMEASSISTANT_START, self.ha_start))
+        if self.shadow:
+            self.hass.services.async_register(
+                DOMAIN, SERVICE_SHADOW_REPORT, self.on_shadow_report, supports_response=SupportsResponse.ONLY
+            )
+            self.unsubscribes.append(partial(self.hass.services.async_remove, DOMAIN, SERVICE_SHADOW_REPORT))
+            self.publish_shadow()
 
     @callback
     async def ha_start(self, _event: Event) -> None:
@@ -194,8 +363,12 @@ class AlarmArmer:
         self.shutdown()
 
     def shutdown(self) -> None:
+        self.shut_down = True
         for unsub in self.unsubscribes:
             unsub()
+        if self.reconcile_unsub:
+            self.reconcile_unsub()
+            self.reconcile_unsub = None
         _LOGGER.info("AUTOARM shut down")
 
     def initialize_alarm_panel(self) -> None:
@@ -206,8 +379,8 @@ class AlarmArmer:
         _LOGGER.debug("AUTOARM Auto-arming %s", self.alarm_panel)
 
     def initialize_diurnal(self) -> None:
-        self.unsubscribes.append(async_track_sunrise(self.hass, self.on_sunrise, None))
-        self.unsubscribes.append(async_track_sunset(self.hass, self.on_sunset, None))
+        self.unsubscribes.append(self.clock.call_at_sunrise(self.on_sunrise))
+        self.unsubscribes.append(self.clock.call_at_sunset(self.on_sunset))
 
     def initialize_occupancy(self) -> None:
         """Configure occupants, and listen for changes in their state"""
@@ -220,17 +393,9 @@ class AlarmArmer:
     def initialize_bedtime(self) -> None:
         """Configure usual bed time (optional)"""
         if self.sleep_start:
-            self.unsubscribes.append(
-                async_track_utc_time_change(
-                    self.hass, self.on_sleep_start, self.sleep_start.hour, self.sleep_start.minute, self.sleep_start.second
-                )
-            )
+            self.unsubscribes.append(self.clock.call_daily(self.sleep_start, self.on_sleep_start))
         if self.sleep_end:
-            self.unsubscribes.append(
-                async_track_utc_time_change(
-                    self.hass, self.on_sleep_end, self.sleep_end.hour, self.sleep_end.minute, self.sleep_end.second
-                )
-            )
+            self.unsubscribes.append(self.clock.call_daily(self.sleep_end, self.on_sleep_end))
         _LOGGER.debug("AUTOARM Bed time from %s->%s", self.sleep_start, self.sleep_end)
 
     def initialize_buttons(self) -> None:
@@ -254,11 +419,18 @@ class AlarmArmer:
             _LOGGER.debug("AUTOARM Failed to load state %s: %s", state, e)
             return None
 
+    def occupant_state(self, entity_id: str) -> str:
+        """Live occupant state, falling back to any restored state while the live one is a zombie"""
+        state = self.safe_state(self.hass.states.get(entity_id))
+        if is_zombie(state):
+            return self.restored_states.get(entity_id, state)
+        return state
+
     def is_occupied(self) -> bool:
-        return any(self.safe_state(self.hass.states.get(p)) == STATE_HOME for p in self.occupants)
+        return any(self.occupant_state(p) == STATE_HOME for p in self.occupants)
 
     def is_unoccupied(self) -> bool:
-        return all(self.safe_state(self.hass.states.get(p)) != STATE_HOME for p in self.occupants)
+        return all(self.occupant_state(p) != STATE_HOME for p in self.occupants)
 
     def is_night(self) -> bool:
         return self.safe_state(self.hass.states.get("sun.sun")) == STATE_BELOW_HORIZON
@@ -268,92 +440,157 @@ class AlarmArmer:
 
     @callback
     async def on_panel_change(self, event: EventType) -> None:
-        entity_id, old, new = self._extract_event(event)
+        change = self._extract_event(event)
+        old, new = change.old, change.new
+        if self.confirm_panel_state(old, new):
+            _LOGGER.debug("AUTOARM Panel Change Confirmed Command: %s: %s-->%s", change.entity_id, old, new)
+            return
         if self.arming_in_progress.is_set():
             _LOGGER.debug(
                 "AUTOARM Panel Change Ignored: %s,%s: %s-->%s",
-                entity_id,
+                change.entity_id,
                 event.event_type,
                 old,
                 new,
             )
             return
-        _LOGGER.info("AUTOARM Panel Change: %s,%s: %s-->%s", entity_id, event.event_type, old, new)
+        _LOGGER.info("AUTOARM Panel Change: %s,%s: %s-->%s", change.entity_id, event.event_type, old, new)
+        self.tighten_reconcile()
 
-        if new in ZOMBIE_STATES:
+        if is_zombie(new):
             _LOGGER.warning("AUTOARM Dezombifying %s ...", new)
             await self.reset_armed_state()
         else:
+            self.record_decision(new)
             message = "Home Assistant alert level now set from %s to %s" % (old, new)
             await self.notify_flex(message, title="Alarm now %s" % new, profile="quiet")
 
-    def _extract_event(self, event: EventType) -> tuple:
-        entity_id = old = new = None
+    def _extract_event(self, event: EventType) -> StateChange:
+        change = StateChange()
         if event and event.data:
-            entity_id = event.data.get("entity_id")
+            change.entity_id = event.data.get("entity_id")
             old_obj = event.data.get("old_state")
             if old_obj:
-                old = old_obj.state
+                change.old = old_obj.state
             new_obj = event.data.get("new_state")
             if new_obj:
-                new = new_obj.state
-        return entity_id, old, new
+                change.new = new_obj.state
+        return change
 
     @callback
     async def on_occupancy_change(self, event: EventType[EventStateChangedData]) -> None:
-        entity_id, old, new = self._extract_event(event)
+        change = self._extract_event(event)
+        _LOGGER.debug("AUTOARM Occupancy Change: %s, %s, %s, %s", change.entity_id, change.old, change.new, event)
+        if not is_zombie(change.new):
+            self.restored_states.pop(change.entity_id, None)
+        self.tighten_reconcile()
+        await self.apply_occupancy()
+
+    async def apply_occupancy(self) -> str:
+        """Arm away when everyone has left, or reset when someone returns to an away armed panel"""
         existing_state = self.armed_state()
-        _LOGGER.debug("AUTOARM Occupancy Change: %s, %s, %s, %s", entity_id, old, new, event)
         if self.is_unoccupied() and existing_state not in OVERRIDE_STATES:
-            await self.arm(STATE_ALARM_ARMED_AWAY)
+            return await self.arm(STATE_ALARM_ARMED_AWAY)
         elif self.is_occupied() and existing_state == STATE_ALARM_ARMED_AWAY:
-            await self.reset_armed_state()
+            return await self.reset_armed_state()
+        self.record_decision(existing_state)
+        return existing_state
 
-    def is_awake(self) -> bool:
-        awake = False
-        if self.sleep_start and self.sleep_end:
-            now = datetime.datetime.now()
-            if now.time() >= self.sleep_end and now.time() <= self.sleep_start:
-                awake = True
-        else:
-            awake = not self.is_night()
+    def is_awake(self, night: bool = None) -> bool:
+        night = self.is_night() if night is None else night
+        awake = awake_at(self.clock.now().time(), self.sleep_start, self.sleep_end, night)
         self.hass.states.async_set("%s.awake" % DOMAIN, awake, {})
         return awake
 
+    async def restore_states(self) -> None:
+        """Seed last known states for occupants and panel still in zombie states after a restart
+
+        Uses a single bulk recorder query for the states just before the entities went zombie, run in the
+        recorder's executor. Restored states expire after RESTORE_TTL seconds, so a tracker that never
+        recovers can't hold the house occupied
+        """
+        live_states = {e: self.hass.states.get(e) for e in [*self.occupants, self.alarm_panel]}
+        zombies = {e: state for e, state in live_states.items() if is_zombie(self.safe_state(state))}
+        if not zombies:
+            return
+        if "recorder" not in self.hass.config.components:
+            _LOGGER.warning("AUTOARM Recorder not available to restore %s", list(zombies))
+            return
+        from homeassistant.components.recorder import get_instance, history
+        from sqlalchemy.exc import SQLAlchemyError
+
+        started = self.clock.monotonic()
+        went_zombie = min((state.last_changed for state in zombies.values() if state is not None), default=None)
+        point_in_time = dt_util.as_utc(went_zombie or self.clock.now()) - datetime.timedelta(milliseconds=1)
+        try:
+            # zero length window, so only the state of each entity at the start time is loaded
+            history_states = await get_instance(self.hass).async_add_executor_job(
+                partial(
+                    history.get_significant_states,
+                    self.hass,
+                    point_in_time,
+                    point_in_time,
+                    list(zombies),
+                    include_start_time_state=True,
+                    significant_changes_only=False,
+                    no_attributes=True,
+                )
+            )
+        except SQLAlchemyError as e:
+            _LOGGER.error("AUTOARM Failed to restore states from recorder: %s", e)
+            return
+        for entity_id, states in history_states.items():
+            if states and not is_zombie(states[-1].state):
+                self.restored_states[entity_id] = states[-1].state
+        elapsed = self.clock.monotonic() - started
+        _LOGGER.info("AUTOARM Restored %s from recorder in %.3fs", self.restored_states, elapsed)
+        self.publish_restored_states(elapsed)
+        if self.restored_states:
+            self.unsubscribes.append(self.clock.call_later(RESTORE_TTL, self.expire_restored_states))
+
+    async def expire_restored_states(self) -> None:
+        """Drop restored states, and apply occupancy from whatever the live states now are"""
+        if not self.restored_states:
+            return
+        _LOGGER.info("AUTOARM Expiring restored states %s", self.restored_states)
+        self.restored_states.clear()
+        self.publish_restored_states()
+        await self.apply_occupancy()
+
+    def publish_restored_states(self, elapsed: float = None) -> None:
+        self.hass.states.async_set("%s.restored_states" % DOMAIN, len(self.restored_states),
+                                   dict(self.restored_states, elapsed=elapsed))
+
     async def reset_armed_state(self, force_arm: bool = True, hint_arming: str = None) -> str:
         """Logic to automatically work out appropriate current armed state"""
         _LOGGER.debug("AUTOARM reset_armed_state(force_arm=%s,hint_arming=%s)", force_arm, hint_arming)
         existing_state = self.armed_state()
-        if existing_state == STATE_ALARM_DISARMED and not force_arm:
-            _LOGGER.debug("AUTOARM Ignoring unforced reset for disarmed")
-            return existing_state
-
-        if existing_state in OVERRIDE_STATES:
-            _LOGGER.debug("AUTOARM Ignoring reset for existing state: %s", existing_state)
+        restored = None
+        if is_zombie(existing_state) and self.alarm_panel in self.restored_states:
+            restored = existing_state = self.restored_states.pop(self.alarm_panel)
+        occupied = self.is_occupied()
+        night = self.is_night()
+        arming_state, reason = decide_armed_state(
+            existing_state,
+            occupied=occupied,
+            awake=self.is_awake(night),
+            auto_disarm=self.auto_disarm,
+            force_arm=force_arm,
+            hint_arming=hint_arming,
+        )
+        if self.shadow:
+            self.shadow.observe(existing_state, occupied, night, force_arm, hint_arming, arming_state)
+            self.publish_shadow()
+        if arming_state is None:
+            _LOGGER.debug("AUTOARM %s: %s", reason, existing_state)
+            if restored:
+                return await self.arm(restored)
+            self.record_decision(existing_state)
             return existing_state
+        _LOGGER.info("AUTOARM %s: %s", reason, arming_state)
+        return await self.arm(arming_state)
 
-        if self.is_occupied():
-            if self.auto_disarm and self.is_awake() and not force_arm:
-                _LOGGER.info("AUTOARM Disarming for occupied during waking hours")
-                return await self.arm(STATE_ALARM_DISARMED)
-            elif not self.is_awake():
-                _LOGGER.info("AUTOARM Arming for occupied out of waking hours")
-                return await self.arm(STATE_ALARM_ARMED_NIGHT)
-            elif hint_arming:
-                _LOGGER.info("AUTOARM Using hinted arming state: %s", hint_arming)
-                return await self.arm(hint_arming)
-            else:
-                _LOGGER.info("AUTOARM Defaulting to armed home")
-                return await self.arm(STATE_ALARM_ARMED_HOME)
-
-        if hint_arming:
-            _LOGGER.info("AUTOARM Using hinted arming state: %s", hint_arming)
-            return await self.arm(hint_arming)
-        else:
-            _LOGGER.info("AUTOARM Defaulting to armed away")
-            return await self.arm(STATE_ALARM_ARMED_AWAY)
-
-    async def delayed_arm(self, arming_state: str, reset: bool, requested_at: time) -> None:
+    async def delayed_arm(self, arming_state: str, reset: bool, requested_at: float) -> None:
         _LOGGER.debug("Delayed_arm %s, reset: %s", arming_state, reset)
 
         if self.last_request is not None and requested_at is not None:
@@ -371,66 +608,222 @@ class AlarmArmer:
         if self.rate_limiter.triggered():
             _LOGGER.debug("AUTOARM Rate limit triggered, skipping arm")
             return None
-        try:
-            self.arming_in_progress.set()
-            existing_state = self.armed_state()
-            if arming_state != existing_state:
-                self.hass.states.async_set(self.alarm_panel, arming_state)
-                _LOGGER.info("AUTOARM Setting %s from %s to %s", self.alarm_panel, existing_state, arming_state)
-                return arming_state
+        # latest request wins, abandoning any panel command awaiting confirmation or queued behind one
+        self.supersede_panel_command()
+        request = self.arm_requests
+        async with self.arming_lock:
+            if request != self.arm_requests:
+                _LOGGER.debug("AUTOARM Skipping arm to %s, superseded by a later request", arming_state)
+                return None
+            try:
+                existing_state = self.armed_state()
+                if arming_state != existing_state:
+                    if self.arm_via_service:
+                        if not await self.command_panel(arming_state):
+                            return None
+                    else:
+                        self.arming_in_progress.set()
+                        self.hass.states.async_set(self.alarm_panel, arming_state)
+                    _LOGGER.info("AUTOARM Setting %s from %s to %s", self.alarm_panel, existing_state, arming_state)
+                    self.record_decision(arming_state)
+                    return arming_state
+                else:
+                    _LOGGER.debug("Skipping arm, as %s already %s", self.alarm_panel, arming_state)
+                    self.record_decision(existing_state)
+                    return existing_state
+            except Exception as e:
+                _LOGGER.debug("AUTOARM Failed to arm: %s", e)
+            finally:
+                self.arming_in_progress.clear()
+
+    async def command_panel(self, arming_state: str) -> str:
+        """Command the panel via its services, waiting for it to confirm, and retrying with backoff
+
+        Returns the confirming state, which may be an intermediate one such as arming, or None if never confirmed
+        or abandoned for a later request or an unexpected panel change
+        """
+        service = PANEL_SERVICES[arming_state]
+        timeout = self.arm_timeout
+        issued_at = self.clock.time()
+        for attempt in range(self.arm_retries + 1):
+            if self.last_request is not None and self.last_request > issued_at:
+                _LOGGER.info("AUTOARM Abandoning %s retries since subsequent manual action", service)
+                return None
+            confirmation = self.hass.loop.create_future()
+            self.panel_confirmation = (arming_state, confirmation)
+            started = self.clock.monotonic()
+            self.panel_command_stats["commands"] += 1
+            try:
+                await self.hass.services.async_call(
+                    "alarm_control_panel", service, {ATTR_ENTITY_ID: self.alarm_panel}, blocking=False
+                )
+                confirmed_state = await self.clock.wait_for(confirmation, timeout)
+                if confirmed_state is None:
+                    _LOGGER.info("AUTOARM Abandoning %s, superseded by a later request or panel change", service)
+                    return None
+                self.panel_command_stats["confirmed"] += 1
+                self.panel_command_stats["last_latency"] = self.clock.monotonic() - started
+                return confirmed_state
+            except asyncio.TimeoutError:
+                _LOGGER.warning("AUTOARM %s not confirmed after %ss, attempt %s", service, timeout, attempt + 1)
+                self.panel_command_stats["timeouts"] += 1
+                timeout *= 2
+            finally:
+                self.panel_confirmation = None
+                self.hass.states.async_set("%s.panel_commands" % DOMAIN, self.panel_command_stats["last_latency"],
+                                           self.panel_command_stats)
+        _LOGGER.error("AUTOARM %s failed to confirm %s", self.alarm_panel, arming_state)
+        return None
+
+    def confirm_panel_state(self, old_state: str, new_state: str) -> bool:
+        """Resolve any panel command awaiting this state, returning True if the change was its confirmation
+
+        Any other change of state, such as triggered, abandons the command rather than retrying against it
+        """
+        if self.panel_confirmation:
+            arming_state, confirmation = self.panel_confirmation
+            if confirmation.done() or new_state == old_state:
+                return False
+            if new_state == arming_state or new_state in TRANSITION_STATES:
+                confirmation.set_result(new_state)
+                return True
+            _LOGGER.warning("AUTOARM Panel changed to %s while awaiting %s", new_state, arming_state)
+            confirmation.set_result(None)
+        return False
+
+    def supersede_panel_command(self) -> None:
+        self.arm_requests += 1
+        if self.panel_confirmation:
+            _arming_state, confirmation = self.panel_confirmation
+            if not confirmation.done():
+                confirmation.set_result(None)
+
+    def record_decision(self, armed_state: str) -> None:
+        """Fingerprint the inputs to the latest decision, for reconciliation to compare against"""
+        self.decision_fingerprint = (self.is_occupied(), self.is_awake(), armed_state)
+
+    def schedule_reconcile(self) -> None:
+        if self.reconcile_unsub:
+            self.reconcile_unsub()
+            self.reconcile_unsub = None
+        if self.shut_down:
+            return
+        self.reconcile_unsub = self.clock.call_later(self.reconcile_interval, self.reconcile)
+
+    def tighten_reconcile(self) -> None:
+        """Check back soon after a change, rather than waiting out a backed off interval"""
+        if self.reconcile_interval > RECONCILE_MIN_INTERVAL:
+            self.reconcile_interval = RECONCILE_MIN_INTERVAL
+            self.schedule_reconcile()
+
+    async def reconcile(self, _now=None) -> None:
+        """Correct panel drift or zombie states missed by the event handlers, backing off while stable"""
+        if self.reconcile_unsub:
+            # cancel rather than orphan any pending check, in case called other than by its timer
+            self.reconcile_unsub()
+            self.reconcile_unsub = None
+        actual_state = self.armed_state()
+        if self.arming_lock.locked() or actual_state in EPHEMERAL_STATES:
+            self.reconcile_interval = RECONCILE_MIN_INTERVAL
+        elif is_zombie(actual_state):
+            _LOGGER.info("AUTOARM Reconciling zombie %s", actual_state)
+            self.reconcile_interval = RECONCILE_MIN_INTERVAL
+            await self.reset_armed_state(force_arm=False)
+        elif (self.is_occupied(), self.is_awake(), actual_state) != self.decision_fingerprint:
+            _LOGGER.info("AUTOARM Reconciling %s, drifted from %s", actual_state, self.decision_fingerprint)
+            self.reconcile_interval = RECONCILE_MIN_INTERVAL
+            if self.decision_fingerprint is None or self.is_occupied() != self.decision_fingerprint[0]:
+                # missed occupancy change, so apply the same rule as the occupancy listener would have
+                await self.apply_occupancy()
             else:
-                _LOGGER.debug("Skipping arm, as %s already %s", self.alarm_panel, arming_state)
-                return existing_state
-        except Exception as e:
-            _LOGGER.debug("AUTOARM Failed to arm: %s", e)
-        finally:
-            self.arming_in_progress.clear()
+                await self.reset_armed_state(force_arm=False)
+        else:
+            self.reconcile_interval = min(self.reconcile_interval * 2, RECONCILE_MAX_INTERVAL)
+        self.schedule_reconcile()
 
     async def notify_flex(self, message: str, profile: str = "normal", title: str = None) -> None:
-        notify_service = None
+        targets = None
         try:
-            # separately merge base dict and data sub-dict as cheap and nasty semi-deep-merge
+            # merge base and selected data sub-dicts as cheap and nasty semi-deep-merge
             selected_profile = self.notify_profiles.get(profile)
             base_profile = self.notify_profiles.get("common", {})
             base_profile_data = base_profile.get("data", {})
             selected_profile_data = selected_profile.get("data", {})
-            merged_profile = dict(base_profile)
-            merged_profile.update(selected_profile)
             merged_profile_data = dict(base_profile_data)
             merged_profile_data.update(selected_profile_data)
-            merged_profile["data"] = merged_profile_data
-            notify_service = merged_profile["service"].replace("notify.", "")
+            targets = profile_targets(selected_profile) or profile_targets(base_profile)
+            if not targets:
+                raise ValueError("no notify service or targets for profile %s" % profile)
 
             title = title or "Alarm Auto Arming"
-            if merged_profile:
-                data = merged_profile.get("data", {})
-                await self.hass.services.async_call(
-                    "notify", notify_service, service_data={"message": message, "title": title, "data": data}
-                )
+            # fan out concurrently, so a slow or dead target can't hold up the others
+            await asyncio.gather(*(self.notify_target(target, message, title, merged_profile_data) for target in targets))
+            self.publish_notify_stats()
 
         except Exception as e:
-            _LOGGER.error("AUTOARM %s failed %s", notify_service, e)
+            _LOGGER.error("AUTOARM %s failed %s", targets, e)
+
+    async def notify_target(self, target, message: str, title: str, data: dict) -> None:
+        if isinstance(target, str):
+            target = {CONF_SERVICE: target}
+        service = target[CONF_SERVICE]
+        breaker = self.notify_breakers.setdefault(service, CircuitBreaker(clock=self.clock))
+        if not breaker.allow():
+            _LOGGER.debug("AUTOARM Skipping %s while circuit breaker open", service)
+            return
+        target_data = dict(data)
+        target_data.update(target.get(CONF_DATA, {}))
+        domain, service_name = service.split(".", 1)
+        started = self.clock.monotonic()
+        try:
+            await self.clock.wait_for(
+                self.hass.services.async_call(
+                    domain, service_name, service_data={"message": message, "title": title, "data": target_data}, blocking=True
+                ),
+                timeout=target.get(CONF_TIMEOUT, NOTIFY_TIMEOUT),
+            )
+            breaker.record_success(self.clock.monotonic() - started)
+        except asyncio.CancelledError:
+            # settle any trial call, so the breaker isn't left half open
+            breaker.record_failure()
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            _LOGGER.error("AUTOARM %s failed %s", service, str(e) or type(e).__name__)
+
+    def publish_notify_stats(self) -> None:
+        self.hass.states.async_set(
+            "%s.notify_targets" % DOMAIN,
+            sum(1 for breaker in self.notify_breakers.values() if not breaker.is_open()),
+            {service: breaker.stats() for service, breaker in self.notify_breakers.items()},
+        )
+
+    def publish_shadow(self) -> None:
+        self.hass.states.async_set("%s.shadow" % DOMAIN, self.shadow.divergence_count, self.shadow.summary())
+
+    async def on_shadow_report(self, call: ServiceCall) -> ServiceResponse:
+        return self.shadow.report()
 
     @callback
-    async def on_sleep_start(self, kwargs) -> None:
+    async def on_sleep_start(self, kwargs=None) -> None:
         _LOGGER.debug("AUTOARM Sleep Period Start: %s", kwargs)
         await self.reset_armed_state(force_arm=True)
 
     @callback
-    async def on_sleep_end(self, kwargs) -> None:
+    async def on_sleep_end(self, kwargs=None) -> None:
         _LOGGER.debug("AUTOARM Sleep Period End: %s", kwargs)
         await self.reset_armed_state(force_arm=False)
 
     @callback
     async def on_reset_button(self, event: EventType[EventStateChangedData]) -> None:
         _LOGGER.debug("AUTOARM Reset Button: %s", event)
-        self.last_request = time.time()
+        self.last_request = self.clock.time()
         await self.reset_armed_state(force_arm=True)
 
     @callback
     async def on_mobile_action(self, event: EventType) -> None:
         _LOGGER.debug("AUTOARM Mobile Action: %s", event)
-        self.last_request = time.time()
+        self.last_request = self.clock.time()
         match event.data.get("action"):
             case "ALARM_PANEL_DISARM":
                 await self.arm(STATE_ALARM_DISARMED)
@@ -444,7 +837,7 @@ class AlarmArmer:
     @callback
     async def on_disarm_button(self, event: EventType[EventStateChangedData]) -> None:
         _LOGGER.debug("AUTOARM Disarm Button: %s", event)
-        self.last_request = time.time()
+        self.last_request = self.clock.time()
         await self.arm(STATE_ALARM_DISARMED)
 
     @callback
@@ -455,13 +848,12 @@ class AlarmArmer:
     @callback
     async def on_away_button(self, event: EventType[EventStateChangedData]) -> None:
         _LOGGER.debug("AUTOARM Away Button: %s", event)
-        self.last_request = time.time()
+        self.last_request = self.clock.time()
         if self.arm_away_delay:
             self.unsubscribes.append(
-                async_track_point_in_time(
-                    self.hass,
-                    partial(self.delayed_arm, STATE_ALARM_ARMED_AWAY, False, dt_util.utc_from_timestamp(time.time())),
-                    dt_util.utc_from_timestamp(time.time() + self.arm_away_delay),
+                self.clock.call_later(
+                    self.arm_away_delay,
+                    partial(self.delayed_arm, STATE_ALARM_ARMED_AWAY, False, self.clock.time()),
                 )
             )
             await self.notify_flex(
@@ -474,16 +866,15 @@ class AlarmArmer:
     @callback
     async def on_sunrise(self) -> None:
         _LOGGER.debug("AUTOARM Sunrise")
-        if not self.sunrise_cutoff or datetime.datetime.now().time() >= self.sunrise_cutoff:
+        if not self.sunrise_cutoff or self.clock.now().time() >= self.sunrise_cutoff:
             await self.reset_armed_state(force_arm=False)
         elif self.sunrise_cutoff < self.sleep_end:
             sunrise_delay = total_secs(self.sleep_end) - total_secs(self.sunrise_cutoff)
             _LOGGER.debug("AUTOARM Rescheduling delayed sunrise action in %s seconds", sunrise_delay)
             self.unsubscribes.append(
-                async_track_point_in_time(
-                    self.hass,
-                    partial(self.delayed_arm, STATE_ALARM_ARMED_HOME, True, dt_util.utc_from_timestamp(time.time())),
-                    dt_util.utc_from_timestamp(time.time() + sunrise_delay),
+                self.clock.call_later(
+                    sunrise_delay,
+                    partial(self.delayed_arm, STATE_ALARM_ARMED_HOME, True, self.clock.time()),
                 )
             )
 
@@ -494,7 +885,10 @@ class AlarmArmer:
 
 
 class Limiter:
-    def __init__(self, window=60, max_calls=4):
+    __slots__ = ("clock", "calls", "window", "max_calls")
+
+    def __init__(self, window=60, max_calls=4, clock: Clock = None):
+        self.clock = clock or Clock()
         self.calls = []
         self.window = window
         self.max_calls = max_calls
@@ -502,8 +896,9 @@ class Limiter:
 
     def triggered(self):
         ''' Register a call and check if window based rate limit triggered '''
-        cut_off = time.time() - self.window
-        self.calls.append(time.time())
+        now = self.clock.time()
+        cut_off = now - self.window
+        self.calls.append(now)
         in_scope = 0
 
         for call in self.calls[:]:
@@ -516,3 +911,166 @@ class Limiter:
             return True
         else:
             return False
+
+
+class CircuitBreaker:
+    """Skip a failing target after repeated failures, until a cooldown has passed
+
+    Once cooled down, a single trial call is let through, closing the breaker on success or reopening it on failure
+    """
+
+    __slots__ = (
+        "clock",
+        "failure_threshold",
+        "cooldown",
+        "failures",
+        "opened_at",
+        "trial_in_flight",
+        "successes",
+        "total_failures",
+        "skipped",
+        "last_latency",
+        "total_latency",
+    )
+
+    def __init__(self, failure_threshold=NOTIFY_BREAKER_FAILURES, cooldown=NOTIFY_BREAKER_COOLDOWN, clock: Clock = None):
+        self.clock = clock or Clock()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.successes = 0
+        self.total_failures = 0
+        self.skipped = 0
+        self.last_latency = None
+        self.total_latency = 0.0
+
+    def is_open(self) -> bool:
+        """Open while cooling down, and while the trial call after cooling down is in flight"""
+        if self.opened_at is None:
+            return False
+        return self.trial_in_flight or self.clock.time() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Check if a call should be attempted, allowing a single trial call once cooled down"""
+        if self.is_open():
+            self.skipped += 1
+            return False
+        if self.opened_at is not None:
+            self.trial_in_flight = True
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.successes += 1
+        self.last_latency = latency
+        self.total_latency += latency
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.total_failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock.time()
+            self.trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "successes": self.successes,
+            "failures": self.total_failures,
+            "skipped": self.skipped,
+            "open": self.is_open(),
+            "last_latency": self.last_latency,
+            "mean_latency": self.total_latency / self.successes if self.successes else None,
+        }
+
+
+class ShadowEvaluator:
+    """Read-only second decision pipeline, fed the same inputs as the live armer's reset decisions
+
+    Only decisions differing from the live armer are kept, in a bounded buffer
+    """
+
+    __slots__ = (
+        "clock",
+        "auto_disarm",
+        "sleep_start",
+        "sleep_end",
+        "divergences",
+        "divergence_count",
+        "evaluations",
+        "total_cost",
+        "max_cost",
+        "over_budget",
+    )
+
+    def __init__(self, clock: Clock, auto_disarm: bool = True, sleep_start: time = None, sleep_end: time = None):
+        self.clock: Clock = clock
+        self.auto_disarm: bool = auto_disarm
+        self.sleep_start: time = sleep_start
+        self.sleep_end: time = sleep_end
+        self.divergences: deque[dict] = deque(maxlen=SHADOW_BUFFER_SIZE)
+        self.divergence_count: int = 0
+        self.evaluations: int = 0
+        self.total_cost: float = 0.0
+        self.max_cost: float = 0.0
+        self.over_budget: int = 0
+
+    def observe(
+        self, existing_state: str, occupied: bool, night: bool, force_arm: bool, hint_arming: str, live_state: str
+    ) -> bool:
+        """Evaluate the shadow decision, returning True if it diverged from the live one"""
+        started = time.perf_counter()
+        now = self.clock.now()
+        awake = awake_at(now.time(), self.sleep_start, self.sleep_end, night)
+        shadow_state, reason = decide_armed_state(
+            existing_state,
+            occupied=occupied,
+            awake=awake,
+            auto_disarm=self.auto_disarm,
+            force_arm=force_arm,
+            hint_arming=hint_arming,
+        )
+        live_outcome = live_state or existing_state
+        shadow_outcome = shadow_state or existing_state
+        diverged = shadow_outcome != live_outcome
+        if diverged:
+            self.divergence_count += 1
+            self.divergences.append(
+                {
+                    "time": now.isoformat(),
+                    "existing": existing_state,
+                    "occupied": occupied,
+                    "awake": awake,
+                    "force_arm": force_arm,
+                    "live": live_outcome,
+                    "shadow": shadow_outcome,
+                    "reason": reason,
+                }
+            )
+        cost = time.perf_counter() - started
+        self.evaluations += 1
+        self.total_cost += cost
+        self.max_cost = max(self.max_cost, cost)
+        if cost > SHADOW_BUDGET_SECS:
+            self.over_budget += 1
+            _LOGGER.debug("AUTOARM Shadow evaluation took %.6fs, over budget", cost)
+        return diverged
+
+    def summary(self) -> dict:
+        """Counts, costs and the latest divergence, small enough to publish as entity attributes"""
+        return {
+            "evaluations": self.evaluations,
+            "divergence_count": self.divergence_count,
+            "latest": self.divergences[-1] if self.divergences else None,
+            "mean_cost": self.total_cost / self.evaluations if self.evaluations else None,
+            "max_cost": self.max_cost,
+            "over_budget": self.over_budget,
+            "budget": SHADOW_BUDGET_SECS,
+        }
+
+    def report(self) -> dict:
+        """Summary plus the full buffer of recent divergences"""
+        return dict(self.summary(), divergences=list(self.divergences))
@@ -0,0 +1,173 @@
+"""Clock used for all time dependent behaviour, so tests and replays can run on virtual time"""
+
+import asyncio
+import datetime
+import heapq
+import inspect
+import itertools
+import time
+from collections.abc import Callable, Iterator
+
+import homeassistant.util.dt as dt_util
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import (
+    async_track_point_in_time,
+    async_track_sunrise,
+    async_track_sunset,
+    async_track_utc_time_change,
+)
+
+
+def _as_job(action: Callable) -> Callable:
+    """Wrap a no argument action, sync or async, as a coroutine function for Home Assistant scheduling"""
+
+    async def job(_now=None) -> None:
+        result = action()
+        if inspect.isawaitable(result):
+            await result
+
+    return job
+
+
+class Clock:
+    """Real time clock, scheduling through Home Assistant
+
+    Scheduled actions are called with no arguments, and may be plain functions or coroutine functions
+    """
+
+    def __init__(self, hass: HomeAssistant = None):
+        self.hass: HomeAssistant = hass
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime.datetime:
+        return dt_util.now()
+
+    def call_later(self, delay: float, action: Callable) -> Callable:
+        return async_track_point_in_time(self.hass, _as_job(action), dt_util.utcnow() + datetime.timedelta(seconds=delay))
+
+    def call_daily(self, at: datetime.time, action: Callable) -> Callable:
+        """Call every day at a UTC time of day"""
+        return async_track_utc_time_change(self.hass, _as_job(action), at.hour, at.minute, at.second)
+
+    def call_at_sunrise(self, action: Callable) -> Callable:
+        return async_track_sunrise(self.hass, _as_job(action), None)
+
+    def call_at_sunset(self, action: Callable) -> Callable:
+        return async_track_sunset(self.hass, _as_job(action), None)
+
+    async def wait_for(self, awaitable, timeout: float):
+        """Await with a timeout, raising asyncio.TimeoutError if it expires"""
+        return await asyncio.wait_for(awaitable, timeout)
+
+
+class VirtualClock(Clock):
+    """Clock that only moves when advanced, firing any due timers in time order as it goes
+
+    Sunrise and sunset are fixed UTC times of day, as there's no location to calculate them from
+    """
+
+    def __init__(
+        self,
+        start: datetime.datetime = None,
+        sunrise: datetime.time = datetime.time(6, 0),
+        sunset: datetime.time = datetime.time(18, 0),
+    ):
+        super().__init__()
+        self.current: datetime.datetime = start or dt_util.utcnow()
+        self.sunrise: datetime.time = sunrise
+        self.sunset: datetime.time = sunset
+        self.timers: list[tuple] = []
+        self.timer_seq = itertools.count()
+
+    def time(self) -> float:
+        return self.current.timestamp()
+
+    def monotonic(self) -> float:
+        return self.current.timestamp()
+
+    def now(self) -> datetime.datetime:
+        return dt_util.as_local(self.current)
+
+    def call_at(self, when: datetime.datetime, action: Callable) -> Callable:
+        timer = [when, next(self.timer_seq), action]
+        heapq.heappush(self.timers, timer)
+
+        def cancel() -> None:
+            timer[2] = None
+
+        return cancel
+
+    def call_later(self, delay: float, action: Callable) -> Callable:
+        return self.call_at(self.current + datetime.timedelta(seconds=delay), action)
+
+    def call_daily(self, at: datetime.time, action: Callable) -> Callable:
+        cancels = []
+
+        def schedule() -> None:
+            utc_now = self.current.astimezone(datetime.timezone.utc)
+            when = datetime.datetime.combine(utc_now.date(), at, tzinfo=datetime.timezone.utc)
+            if when <= utc_now:
+                when += datetime.timedelta(days=1)
+            cancels[:] = [self.call_at(when, fire)]
+
+        def fire():
+            schedule()
+            return action()
+
+        schedule()
+        return lambda: cancels[0]()
+
+    def call_at_sunrise(self, action: Callable) -> Callable:
+        return self.call_daily(self.sunrise, action)
+
+    def call_at_sunset(self, action: Callable) -> Callable:
+        return self.call_daily(self.sunset, action)
+
+    async def wait_for(self, awaitable, timeout: float):
+        """Await with a timeout that expires in virtual time, when the clock is advanced past it"""
+        future = asyncio.ensure_future(awaitable)
+        expired = []
+
+        def expire() -> None:
+            if not future.done():
+                expired.append(True)
+                future.cancel()
+
+        cancel = self.call_later(timeout, expire)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if expired:
+                raise asyncio.TimeoutError from None
+            raise
+        finally:
+            cancel()
+
+    def due(self, until: datetime.datetime) -> Iterator[tuple[datetime.datetime, Callable]]:
+        """Step through timers due up to a point in time, moving the clock to each in turn
+
+        Timers scheduled while stepping are included if due in time
+        """
+        while self.timers and self.timers[0][0] <= until:
+            when, _, action = heapq.heappop(self.timers)
+            if action is not None:
+                self.current = max(self.current, when.astimezone(self.current.tzinfo))
+                yield self.current, action
+        self.current = max(self.current, until.astimezone(self.current.tzinfo))
+
+    def tick(self, until: datetime.datetime) -> None:
+        """Advance to a point in time, firing due timers which must be plain functions"""
+        for _when, action in self.due(until):
+            action()
+
+    async def advance(self, seconds: float) -> None:
+        """Advance by some seconds, firing and awaiting due timers"""
+        for _when, action in self.due(self.current + datetime.timedelta(seconds=seconds)):
+            result = action()
+            if inspect.isawaitable(result):
+                await result
@@ -3,7 +3,7 @@
 import logging
 import voluptuous as vol
 from homeassistant.helpers import config_validation as cv
-from homeassistant.const import CONF_ICON, CONF_SERVICE
+from homeassistant.const import CONF_ICON, CONF_SERVICE, CONF_TIMEOUT
 
 DOMAIN = "autoarm"
 
@@ -15,6 +15,7 @@ CONF_DATA = "data"
 CONF_TITLE = "title"
 CONF_URI = "uri"
 CONF_NOTIFY = "notify"
+CONF_TARGETS = "targets"
 CONF_ALARM_PANEL = "alarm_panel"
 CONF_AUTO_ARM = "auto_arm"
 CONF_SLEEP_START = "sleep_start"
@@ -27,6 +28,11 @@ CONF_BUTTON_ENTITY_DISARM = "disarm_button"
 CONF_OCCUPANTS = "occupants"
 CONF_THROTTLE_SECONDS = "throttle_seconds"
 CONF_THROTTLE_CALLS = "throttle_calls"
+CONF_ARM_VIA_SERVICE = "arm_via_service"
+CONF_ARM_TIMEOUT = "arm_timeout"
+CONF_ARM_RETRIES = "arm_retries"
+CONF_RESTORE_FROM_RECORDER = "restore_from_recorder"
+CONF_SHADOW = "shadow"
 
 NOTIFY_COMMON = "common"
 NOTIFY_QUIET = "quiet"
@@ -45,16 +51,44 @@ PUSH_ACTION_SCHEMA = vol.Schema(
     extra=vol.ALLOW_EXTRA,
 )
 
-NOTIFY_DEF_SCHEMA = vol.Schema({vol.Optional(CONF_SERVICE): cv.service, vol.Optional(CONF_DATA): dict})
+# a zero timeout would fail every call
+TIMEOUT_SECONDS = vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False))
+
+NOTIFY_TARGET_SCHEMA = vol.Any(
+    cv.service,
+    vol.Schema(
+        {
+            vol.Required(CONF_SERVICE): cv.service,
+            vol.Optional(CONF_DATA): dict,
+            vol.Optional(CONF_TIMEOUT): TIMEOUT_SECONDS,
+        }
+    ),
+)
+
+NOTIFY_DEF_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_SERVICE): cv.service,
+        vol.Optional(CONF_TARGETS): vol.All(cv.ensure_list, [NOTIFY_TARGET_SCHEMA]),
+        vol.Optional(CONF_DATA): dict,
+    }
+)
 
 NOTIFY_SCHEMA = vol.Schema(
     {
-        vol.Optional(NOTIFY_COMMON): {vol.Required(CONF_SERVICE): cv.service, vol.Optional(CONF_DATA): dict},
+        vol.Optional(NOTIFY_COMMON): vol.All(NOTIFY_DEF_SCHEMA, cv.has_at_least_one_key(CONF_SERVICE, CONF_TARGETS)),
         vol.Optional(NOTIFY_QUIET): NOTIFY_DEF_SCHEMA,
         vol.Optional(NOTIFY_NORMAL): NOTIFY_DEF_SCHEMA,
     }
 )
 
+SHADOW_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_AUTO_ARM): cv.boolean,
+        vol.Optional(CONF_SLEEP_START): cv.time,
+        vol.Optional(CONF_SLEEP_END): cv.time,
+    }
+)
+
 CONFIG_SCHEMA = vol.Schema(
     {
         DOMAIN: vol.Schema(
@@ -73,6 +107,11 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Optional(CONF_NOTIFY, default={}): NOTIFY_SCHEMA,
                 vol.Optional(CONF_THROTTLE_SECONDS, default=60): cv.positive_int,
                 vol.Optional(CONF_THROTTLE_CALLS, default=6): cv.positive_int,
+                vol.Optional(CONF_ARM_VIA_SERVICE, default=False): cv.boolean,
+                vol.Optional(CONF_ARM_TIMEOUT, default=10): TIMEOUT_SECONDS,
+                vol.Optional(CONF_ARM_RETRIES, default=2): cv.positive_int,
+                vol.Optional(CONF_RESTORE_FROM_RECORDER, default=False): cv.boolean,
+                vol.Optional(CONF_SHADOW): SHADOW_SCHEMA,
             }
         )
     },
@@ -0,0 +1,315 @@
+"""Sweep a grid of candidate configurations over recorded history
+
+Replays recorded state changes through the same decision logic as AlarmArmer, once per
+candidate configuration, spread across CPU cores, and ranks the candidates.
+
+    python -m custom_components.autoarm.sweep history.jsonl grid.yaml --top 10
+
+History is JSON lines, one state change per line, in time order:
+
+    {"time": "2024-01-05T07:30:00+00:00", "entity_id": "person.house_owner", "state": "home"}
+
+The grid file has a `base` autoarm configuration, and a `grid` of values to try for any
+configuration keys, e.g. `sleep_start`, `sunrise_cutoff`, `arm_away_delay` or `throttle_calls`.
+
+Waking hours and the sunrise cutoff are judged in local time, as on the live armer, so pass
+`--time-zone` with the Home Assistant time zone, as history exports are usually in UTC.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import homeassistant.util.dt as dt_util
+import voluptuous as vol
+import yaml
+from homeassistant.components.sun import STATE_BELOW_HORIZON
+from homeassistant.const import (
+    STATE_ALARM_ARMED_AWAY,
+    STATE_ALARM_ARMED_HOME,
+    STATE_ALARM_DISARMED,
+    STATE_HOME,
+)
+
+from .autoarming import (
+    OVERRIDE_STATES,
+    Limiter,
+    awake_at,
+    decide_armed_state,
+    is_zombie,
+    total_secs,
+)
+from .clock import VirtualClock
+from .const import (
+    CONF_ALARM_PANEL,
+    CONF_ARM_AWAY_DELAY,
+    CONF_AUTO_ARM,
+    CONF_BUTTON_ENTITY_AWAY,
+    CONF_BUTTON_ENTITY_DISARM,
+    CONF_BUTTON_ENTITY_RESET,
+    CONF_OCCUPANTS,
+    CONF_SLEEP_END,
+    CONF_SLEEP_START,
+    CONF_SUNRISE_CUTOFF,
+    CONF_THROTTLE_CALLS,
+    CONF_THROTTLE_SECONDS,
+    CONFIG_SCHEMA,
+    DOMAIN,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+METRIC_DISARMED_UNOCCUPIED = "disarmed_unoccupied_secs"
+METRIC_AWAY_OCCUPIED = "armed_away_occupied_secs"
+METRIC_STATE_CHANGES = "state_changes"
+METRIC_RATE_LIMIT_HITS = "rate_limit_hits"
+DEFAULT_RANKING = [METRIC_DISARMED_UNOCCUPIED, METRIC_AWAY_OCCUPIED, METRIC_RATE_LIMIT_HITS, METRIC_STATE_CHANGES]
+
+_HISTORY: list[tuple] = []
+
+
+def parse_time(v: str) -> datetime.datetime:
+    when = datetime.datetime.fromisoformat(v.replace("Z", "+00:00"))
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when
+
+
+def load_history(path: str) -> list[tuple]:
+    """Load JSON lines history as a time ordered list of (time, entity_id, state)"""
+    history = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                history.append((parse_time(record["time"]), record["entity_id"], record["state"]))
+    history.sort(key=lambda r: r[0])
+    return history
+
+
+def expand_grid(base: dict, grid: dict) -> tuple[list[dict], list[tuple[dict, str]]]:
+    """Expand a grid into validated candidate configs, with any rejected by CONFIG_SCHEMA"""
+    candidates = []
+    rejected = []
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        try:
+            config = CONFIG_SCHEMA({DOMAIN: dict(base, **params)})[DOMAIN]
+            candidates.append({"params": params, "config": config})
+        except vol.Invalid as e:
+            rejected.append((params, str(e)))
+    return candidates, rejected
+
+
+class Replay:
+    """Stripped down AlarmArmer, driven by recorded history rather than live Home Assistant events"""
+
+    def __init__(self, config: dict, initial_panel_state: str = STATE_ALARM_DISARMED):
+        self.alarm_panel: str = config[CONF_ALARM_PANEL]
+        self.auto_disarm: bool = config.get(CONF_AUTO_ARM, True)
+        self.sleep_start: datetime.time = config.get(CONF_SLEEP_START)
+        self.sleep_end: datetime.time = config.get(CONF_SLEEP_END)
+        self.sunrise_cutoff: datetime.time = config.get(CONF_SUNRISE_CUTOFF)
+        self.arm_away_delay: int = config.get(CONF_ARM_AWAY_DELAY)
+        self.occupants: list[str] = config.get(CONF_OCCUPANTS, [])
+        self.buttons: dict[str, callable] = {
+            config.get(CONF_BUTTON_ENTITY_RESET): self.on_reset_button,
+            config.get(CONF_BUTTON_ENTITY_AWAY): self.on_away_button,
+            config.get(CONF_BUTTON_ENTITY_DISARM): self.on_disarm_button,
+        }
+        self.buttons.pop(None, None)
+        self.clock: VirtualClock = None
+        self.rate_limiter: Limiter = None
+        self.throttle_seconds: int = config.get(CONF_THROTTLE_SECONDS, 60)
+        self.throttle_calls: int = config.get(CONF_THROTTLE_CALLS, 6)
+        self.states: dict[str, str] = {self.alarm_panel: initial_panel_state}
+        self.accounted_until: datetime.datetime = None
+        self.last_request: datetime.datetime = None
+        self.metrics: dict[str, float] = {m: 0 for m in DEFAULT_RANKING}
+
+    def run(self, history: list[tuple]) -> dict[str, float]:
+        if not history:
+            return self.metrics
+        self.accounted_until = history[0][0]
+        self.clock = VirtualClock(history[0][0])
+        self.rate_limiter = Limiter(window=self.throttle_seconds, max_calls=self.throttle_calls, clock=self.clock)
+        if self.sleep_start:
+            self.clock.call_daily(self.sleep_start, partial(self.reset_armed_state, force_arm=True))
+        if self.sleep_end:
+            self.clock.call_daily(self.sleep_end, partial(self.reset_armed_state, force_arm=False))
+        for when, entity_id, state in history:
+            self.advance(when)
+            self.on_state(entity_id, state)
+        self.advance(history[-1][0])
+        return self.metrics
+
+    def advance(self, until: datetime.datetime) -> None:
+        for when, action in self.clock.due(until):
+            self.accumulate(when)
+            action()
+        self.accumulate(until)
+
+    def accumulate(self, when: datetime.datetime) -> None:
+        elapsed = (when - self.accounted_until).total_seconds()
+        if elapsed > 0:
+            panel = self.states.get(self.alarm_panel)
+            occupied = self.is_occupied()
+            if panel == STATE_ALARM_DISARMED and not occupied:
+                self.metrics[METRIC_DISARMED_UNOCCUPIED] += elapsed
+            elif panel == STATE_ALARM_ARMED_AWAY and occupied:
+                self.metrics[METRIC_AWAY_OCCUPIED] += elapsed
+            self.accounted_until = when
+
+    def on_state(self, entity_id: str, new: str) -> None:
+        old = self.states.get(entity_id)
+        if entity_id == self.alarm_panel:
+            # only zombie states are replayed, other recorded changes were decisions of the config in force
+            if is_zombie(new):
+                self.states[entity_id] = new
+                self.reset_armed_state()
+            return
+        self.states[entity_id] = new
+        if old == new:
+            return
+        if entity_id in self.occupants:
+            self.on_occupancy_change()
+        elif entity_id == "sun.sun":
+            if new == STATE_BELOW_HORIZON:
+                self.reset_armed_state(force_arm=True)
+            elif old == STATE_BELOW_HORIZON:
+                self.on_sunrise()
+        elif entity_id in self.buttons:
+            self.buttons[entity_id]()
+
+    def is_occupied(self) -> bool:
+        return any(self.states.get(p) == STATE_HOME for p in self.occupants)
+
+    def is_awake(self) -> bool:
+        night = self.states.get("sun.sun") == STATE_BELOW_HORIZON
+        return awake_at(self.clock.now().time(), self.sleep_start, self.sleep_end, night)
+
+    def on_occupancy_change(self) -> None:
+        existing_state = self.states.get(self.alarm_panel)
+        if not self.is_occupied() and existing_state not in OVERRIDE_STATES:
+            self.arm(STATE_ALARM_ARMED_AWAY)
+        elif self.is_occupied() and existing_state == STATE_ALARM_ARMED_AWAY:
+            self.reset_armed_state()
+
+    def on_sunrise(self) -> None:
+        if not self.sunrise_cutoff or self.clock.now().time() >= self.sunrise_cutoff:
+            self.reset_armed_state(force_arm=False)
+        elif self.sleep_end and self.sunrise_cutoff < self.sleep_end:
+            sunrise_delay = total_secs(self.sleep_end) - total_secs(self.sunrise_cutoff)
+            self.clock.call_later(sunrise_delay, partial(self.delayed_arm, STATE_ALARM_ARMED_HOME, True, self.clock.now()))
+
+    def on_reset_button(self) -> None:
+        self.last_request = self.clock.now()
+        self.reset_armed_state(force_arm=True)
+
+    def on_disarm_button(self) -> None:
+        self.last_request = self.clock.now()
+        self.arm(STATE_ALARM_DISARMED)
+
+    def on_away_button(self) -> None:
+        self.last_request = self.clock.now()
+        if self.arm_away_delay:
+            self.clock.call_later(
+                self.arm_away_delay, partial(self.delayed_arm, STATE_ALARM_ARMED_AWAY, False, self.clock.now())
+            )
+        else:
+            self.arm(STATE_ALARM_ARMED_AWAY)
+
+    def delayed_arm(self, arming_state: str, reset: bool, requested_at: datetime.datetime) -> None:
+        if self.last_request is not None and self.last_request > requested_at:
+            return
+        if reset:
+            self.reset_armed_state(force_arm=True, hint_arming=arming_state)
+        else:
+            self.arm(arming_state)
+
+    def reset_armed_state(self, force_arm: bool = True, hint_arming: str = None) -> None:
+        arming_state, _ = decide_armed_state(
+            self.states.get(self.alarm_panel),
+            occupied=self.is_occupied(),
+            awake=self.is_awake(),
+            auto_disarm=self.auto_disarm,
+            force_arm=force_arm,
+            hint_arming=hint_arming,
+        )
+        if arming_state is not None:
+            self.arm(arming_state)
+
+    def arm(self, arming_state: str) -> None:
+        if self.rate_limiter.triggered():
+            self.metrics[METRIC_RATE_LIMIT_HITS] += 1
+            return
+        if arming_state != self.states.get(self.alarm_panel):
+            self.states[self.alarm_panel] = arming_state
+            self.metrics[METRIC_STATE_CHANGES] += 1
+
+
+def _init_worker(history_path: str, time_zone: str = None) -> None:
+    global _HISTORY  # noqa: PLW0603
+    if time_zone:
+        dt_util.set_default_time_zone(dt_util.get_time_zone(time_zone))
+    _HISTORY = load_history(history_path)
+
+
+def _evaluate(candidate: dict) -> dict:
+    return {"params": candidate["params"], "metrics": Replay(candidate["config"]).run(_HISTORY)}
+
+
+def sweep(history_path: str, candidates: list[dict], workers: int = None, time_zone: str = None) -> list[dict]:
+    """Evaluate candidates in a process pool, each worker loading the history once
+
+    Local times are in time_zone if given, otherwise the default Home Assistant time zone
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(candidates) // (workers * 4))
+    initargs = (history_path, time_zone)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        return list(executor.map(_evaluate, candidates, chunksize=chunksize))
+
+
+def rank(results: list[dict], ranking: list[str] = None) -> list[dict]:
+    ranking = ranking or DEFAULT_RANKING
+    return sorted(results, key=lambda r: tuple(r["metrics"][m] for m in ranking))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rank autoarm configurations against recorded history")
+    parser.add_argument("history", help="JSON lines file of recorded state changes")
+    parser.add_argument("grid", help="YAML file with base config and grid of candidate values")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, default one per CPU")
+    parser.add_argument("--top", type=int, default=10, help="Number of ranked candidates to show")
+    parser.add_argument("--rank-by", nargs="+", default=DEFAULT_RANKING, choices=DEFAULT_RANKING)
+    parser.add_argument("--time-zone", default=None, help="Local time zone of the site, e.g. Europe/London, default UTC")
+    args = parser.parse_args(argv)
+    if args.time_zone and dt_util.get_time_zone(args.time_zone) is None:
+        print("Unknown time zone %s" % args.time_zone, file=sys.stderr)
+        return 1
+
+    with open(args.grid, "r", encoding="utf-8") as f:
+        grid_def = yaml.safe_load(f)
+    candidates, rejected = expand_grid(grid_def.get("base", {}), grid_def.get("grid", {}))
+    for params, error in rejected:
+        print("Rejected %s: %s" % (params, error), file=sys.stderr)
+    if not candidates:
+        print("No valid candidates", file=sys.stderr)
+        return 1
+
+    results = rank(sweep(args.history, candidates, workers=args.workers, time_zone=args.time_zone), args.rank_by)
+    for result in results[: args.top]:
+        print(json.dumps({"params": result["params"], "metrics": result["metrics"]}, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
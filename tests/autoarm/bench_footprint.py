@@ -0,0 +1,64 @@
+"""Measure the runtime footprint of the armer's per instance and per event structures
+
+Not collected by pytest, run directly with `python -m tests.autoarm.bench_footprint`
+"""
+
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from custom_components.autoarm.autoarming import OVERRIDE_STATES, AlarmArmer, StateChange, is_zombie
+
+EVENTS = 1000
+
+
+def instance_bytes() -> tuple[int, int]:
+    """Slotted armer size, against the same attributes held in an instance dict"""
+    armer = AlarmArmer(Mock(), "alarm_panel.bench", occupants=["person.bench"])
+    attributes = {name: getattr(armer, name) for name in AlarmArmer.__slots__}
+    return sys.getsizeof(armer), sys.getsizeof(object()) + sys.getsizeof(attributes)
+
+
+def event_bytes(extract) -> float:
+    """Bytes retained per extracted state change event"""
+    old, new = SimpleNamespace(state="disarmed"), SimpleNamespace(state="armed_home")
+    event = SimpleNamespace(data={"entity_id": "alarm_panel.bench", "old_state": old, "new_state": new})
+    extract(event)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [extract(event) for _ in range(EVENTS)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return retained / EVENTS - 8  # less the list slot holding each result
+
+
+def extract_change(event) -> StateChange:
+    return StateChange(event.data["entity_id"], event.data["old_state"].state, event.data["new_state"].state)
+
+
+def extract_tuple(event) -> tuple:
+    return event.data["entity_id"], event.data["old_state"].state, event.data["new_state"].state
+
+
+def membership_ns(check, number=200000) -> float:
+    return timeit.timeit(check, number=number) / number * 1e9
+
+
+def main() -> None:
+    slotted, unslotted = instance_bytes()
+    print("armer instance: %s bytes slotted, %s bytes with an attribute dict" % (slotted, unslotted))
+    change, plain = event_bytes(extract_change), event_bytes(extract_tuple)
+    print("event extraction: %.0f bytes StateChange, %.0f bytes tuple" % (change, plain))
+    override_set = frozenset(OVERRIDE_STATES)
+    in_tuple = membership_ns(lambda: "armed_home" in OVERRIDE_STATES)
+    in_set = membership_ns(lambda: "armed_home" in override_set)
+    print("override check: %.0fns tuple, %.0fns frozenset" % (in_tuple, in_set))
+    print("zombie check: %.0fns" % membership_ns(lambda: is_zombie("armed_home")))
+
+
+if __name__ == "__main__":
+    main()
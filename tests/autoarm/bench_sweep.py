@@ -0,0 +1,68 @@
+"""Time a configuration sweep over a synthetic year of history
+
+Not collected by pytest, run directly with `python -m tests.autoarm.bench_sweep [candidates] [workers]`
+"""
+
+import datetime
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from custom_components.autoarm.sweep import expand_grid, sweep
+
+BASE = {
+    "alarm_panel": "alarm_panel.bench",
+    "occupants": ["person.bench_a", "person.bench_b"],
+    "away_button": "binary_sensor.bench_away",
+}
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def synthetic_year() -> list[dict]:
+    """Daily sun, weekday commute and occasional away button events, around 1900 state changes in all"""
+    history = []
+
+    def record(day: int, hour: float, entity_id: str, state: str) -> None:
+        when = START + datetime.timedelta(days=day, hours=hour)
+        history.append({"time": when.isoformat(), "entity_id": entity_id, "state": state})
+
+    for day in range(365):
+        record(day, 7 + (day % 5) / 10, "sun.sun", "above_horizon")
+        record(day, 16 + (day % 7) / 10, "sun.sun", "below_horizon")
+        if day % 7 < 5:
+            record(day, 8, "person.bench_a", "not_home")
+            record(day, 8.5, "person.bench_b", "not_home")
+            record(day, 17.5, "person.bench_a", "home")
+            record(day, 18, "person.bench_b", "home")
+        if day % 3 == 0:
+            record(day, 8.2, "binary_sensor.bench_away", "on" if day % 2 else "off")
+    history.sort(key=lambda r: r["time"])
+    return history
+
+
+def grid(size: int) -> dict:
+    """Grid of at least size points over sleep, sunrise, away delay and throttle settings"""
+    sleep_starts = ["21:00:00", "21:30:00", "22:00:00", "22:30:00", "23:00:00"]
+    cutoffs = ["05:30:00", "06:00:00", "06:30:00", "07:00:00", "07:30:00"]
+    delays = list(range(0, 600, 60))
+    throttles = list(range(2, 2 + max(1, -(-size // (len(sleep_starts) * len(cutoffs) * len(delays))))))
+    return {"sleep_start": sleep_starts, "sunrise_cutoff": cutoffs, "arm_away_delay": delays, "throttle_calls": throttles}
+
+
+def main(size: int = 1000, workers: int = None) -> None:
+    candidates, _ = expand_grid(dict(BASE, sleep_end="06:30:00"), grid(size))
+    candidates = candidates[:size]
+    with tempfile.TemporaryDirectory() as tmp:
+        history_path = Path(tmp) / "history.jsonl"
+        events = synthetic_year()
+        history_path.write_text("\n".join(json.dumps(e) for e in events))
+        started = time.perf_counter()
+        sweep(str(history_path), candidates, workers=workers, time_zone="Europe/London")
+        elapsed = time.perf_counter() - started
+    print("%s candidates over %s events in %.1fs" % (len(candidates), len(events), elapsed))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,7 +1,18 @@
+import asyncio
+import datetime
+from unittest.mock import AsyncMock, Mock, patch
+
 import pytest
-from homeassistant.core import HomeAssistant
+from homeassistant.components.recorder import history
+from homeassistant.core import HomeAssistant, State
 
-from custom_components.autoarm.autoarming import AlarmArmer
+from custom_components.autoarm.autoarming import (
+    RECONCILE_MIN_INTERVAL,
+    RESTORE_TTL,
+    AlarmArmer,
+    is_zombie,
+)
+from custom_components.autoarm.clock import VirtualClock
 
 TEST_PANEL = "alarm_control_panel.test_panel"
 
@@ -69,3 +80,300 @@ async def test_reset_sets_disarmed_from_unknown(hass: HomeAssistant, autoarmer:
     hass.states.async_set("person.tester_bob", "home")
     hass.states.async_set(TEST_PANEL, "unknown")
     assert await autoarmer.reset_armed_state(force_arm=False) == "disarmed"
+
+
+def live_timers(clock: VirtualClock) -> int:
+    return sum(1 for _when, _seq, action in clock.timers if action is not None)
+
+
+async def test_reconcile_dezombifies_panel(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "not_home")
+    clock = VirtualClock()
+    # not initialized, so no listeners, leaving the zombie panel for reconciliation to find
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], clock=clock)
+    await uut.reset_armed_state(force_arm=True)
+    uut.schedule_reconcile()
+    hass.states.async_set(TEST_PANEL, "unavailable")
+    await clock.advance(RECONCILE_MIN_INTERVAL)
+    assert uut.armed_state() == "armed_away"
+    assert uut.reconcile_interval == RECONCILE_MIN_INTERVAL
+    uut.shutdown()
+
+
+async def test_reconcile_arms_away_for_missed_departure(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "not_home")
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    clock = VirtualClock()
+    # not initialized, so no listeners, as if the departure event was missed
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], clock=clock)
+    uut.decision_fingerprint = (True, True, "disarmed")
+    uut.schedule_reconcile()
+    await clock.advance(RECONCILE_MIN_INTERVAL)
+    assert uut.armed_state() == "armed_away"
+    assert uut.decision_fingerprint == (False, True, "armed_away")
+    uut.shutdown()
+
+
+async def test_reconcile_backs_off_when_stable(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "not_home")
+    clock = VirtualClock()
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], clock=clock)
+    await uut.initialize()
+    await clock.advance(RECONCILE_MIN_INTERVAL)
+    await clock.advance(RECONCILE_MIN_INTERVAL * 2)
+    assert uut.reconcile_interval == RECONCILE_MIN_INTERVAL * 4
+    assert uut.armed_state() == "armed_away"
+    uut.shutdown()
+    assert live_timers(clock) == 0
+
+
+async def test_reconcile_keeps_single_timer_and_stops_at_shutdown(hass: HomeAssistant):
+    clock = VirtualClock()
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], clock=clock)
+    uut.schedule_reconcile()
+    await uut.reconcile()
+    assert live_timers(clock) == 1
+    uut.shutdown()
+    await uut.reconcile()
+    assert uut.reconcile_unsub is None
+    assert live_timers(clock) == 0
+
+
+async def test_notify_fans_out_past_failing_target(hass: HomeAssistant, autoarmer: AlarmArmer):
+    delivered = []
+
+    async def working(call):
+        delivered.append(call.data["message"])
+
+    async def broken(call):
+        raise RuntimeError("push service down")
+
+    hass.services.async_register("notify", "working", working)
+    hass.services.async_register("notify", "broken", broken)
+    autoarmer.notify_profiles = {"normal": {"targets": ["notify.broken", {"service": "notify.working", "timeout": 1}]}}
+    for _ in range(4):
+        await autoarmer.notify_flex("test alert")
+
+    assert delivered == ["test alert"] * 4
+    stats = hass.states.get("autoarm.notify_targets").attributes
+    assert stats["notify.working"]["successes"] == 4
+    assert stats["notify.broken"]["failures"] == 3
+    assert stats["notify.broken"]["skipped"] == 1
+    assert stats["notify.broken"]["open"] is True
+
+
+async def test_arm_via_service_waits_for_confirmation(hass: HomeAssistant, autoarmer: AlarmArmer):
+    async def arm_home(call):
+        hass.states.async_set(TEST_PANEL, "armed_home")
+
+    hass.services.async_register("alarm_control_panel", "alarm_arm_home", arm_home)
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "home")
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    autoarmer.arm_via_service = True
+    assert await autoarmer.arm("armed_home") == "armed_home"
+    assert autoarmer.panel_command_stats["confirmed"] == 1
+    assert autoarmer.panel_command_stats["last_latency"] is not None
+
+
+async def test_arm_via_service_retries_unconfirmed(hass: HomeAssistant, autoarmer: AlarmArmer):
+    async def ignore(call):
+        pass
+
+    hass.services.async_register("alarm_control_panel", "alarm_arm_away", ignore)
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    autoarmer.arm_via_service = True
+    autoarmer.arm_timeout = 0.01
+    autoarmer.arm_retries = 1
+    assert await autoarmer.arm("armed_away") is None
+    assert autoarmer.panel_command_stats["commands"] == 2
+    assert autoarmer.panel_command_stats["timeouts"] == 2
+    assert hass.states.get(TEST_PANEL).state == "disarmed"
+
+
+async def test_arm_via_service_superseded_by_later_request(hass: HomeAssistant, autoarmer: AlarmArmer):
+    commands = []
+
+    async def away_ignored(call):
+        commands.append(call.service)
+
+    async def disarm(call):
+        commands.append(call.service)
+        hass.states.async_set(TEST_PANEL, "disarmed")
+
+    hass.services.async_register("alarm_control_panel", "alarm_arm_away", away_ignored)
+    hass.services.async_register("alarm_control_panel", "alarm_disarm", disarm)
+    hass.states.async_set(TEST_PANEL, "armed_home")
+    autoarmer.arm_via_service = True
+    autoarmer.arm_timeout = 0.05
+    away = hass.async_create_task(autoarmer.arm("armed_away"))
+    await asyncio.sleep(0.01)
+    assert await autoarmer.arm("disarmed") == "disarmed"
+    assert await away is None
+    await asyncio.sleep(0.2)
+    assert commands == ["alarm_arm_away", "alarm_disarm"]
+    assert hass.states.get(TEST_PANEL).state == "disarmed"
+    assert not autoarmer.arming_lock.locked()
+
+
+async def test_panel_triggered_while_command_unconfirmed(hass: HomeAssistant, autoarmer: AlarmArmer):
+    commands = []
+
+    async def ignore(call):
+        commands.append(call.service)
+
+    hass.services.async_register("alarm_control_panel", "alarm_arm_away", ignore)
+    hass.states.async_set(TEST_PANEL, "armed_home")
+    autoarmer.arm_via_service = True
+    autoarmer.arm_timeout = 0.05
+    await hass.async_block_till_done()
+    with patch.object(AlarmArmer, "notify_flex", new_callable=AsyncMock) as notify_flex:
+        away = hass.async_create_task(autoarmer.arm("armed_away"))
+        await asyncio.sleep(0.01)
+        hass.states.async_set(TEST_PANEL, "triggered")
+        await hass.async_block_till_done()
+        assert await away is None
+    notify_flex.assert_awaited_once()
+    # default retries are abandoned, rather than re-arming a triggered panel
+    await asyncio.sleep(0.4)
+    assert commands == ["alarm_arm_away"]
+    assert autoarmer.panel_command_stats["timeouts"] == 0
+    assert hass.states.get(TEST_PANEL).state == "triggered"
+
+
+async def test_away_button_arms_after_delay(hass: HomeAssistant):
+    clock = VirtualClock()
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], arm_away_delay=180, clock=clock)
+    await uut.initialize()
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    await uut.on_away_button(None)
+    await clock.advance(179)
+    assert uut.armed_state() == "disarmed"
+    await clock.advance(1)
+    assert uut.armed_state() == "armed_away"
+    uut.shutdown()
+
+
+async def test_sunrise_disarms_on_virtual_clock(hass: HomeAssistant):
+    clock = VirtualClock(datetime.datetime(2024, 1, 5, 5, 0, tzinfo=datetime.timezone.utc), sunrise=datetime.time(6, 0))
+    hass.states.async_set("sun.sun", "below_horizon")
+    hass.states.async_set("person.tester_bob", "home")
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], clock=clock)
+    await uut.initialize()
+    assert uut.armed_state() == "armed_night"
+    # keep reconciliation out of the way, so only sunrise changes the panel
+    uut.reconcile_unsub()
+    uut.reconcile_unsub = None
+    hass.states.async_set("sun.sun", "above_horizon")
+    await clock.advance(3599)
+    assert uut.armed_state() == "armed_night"
+    await clock.advance(1)
+    assert uut.armed_state() == "disarmed"
+    uut.shutdown()
+
+
+async def test_restore_states_from_recorder(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "unknown")
+    hass.states.async_set(TEST_PANEL, "unavailable")
+    hass.config.components.add("recorder")
+    recorder = Mock()
+    recorder.async_add_executor_job = AsyncMock(
+        return_value={
+            "person.tester_bob": [State("person.tester_bob", "home")],
+            TEST_PANEL: [State(TEST_PANEL, "armed_vacation")],
+        }
+    )
+    with patch("homeassistant.components.recorder.get_instance", return_value=recorder):
+        uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], restore_from_recorder=True)
+        await uut.initialize()
+
+    recorder.async_add_executor_job.assert_awaited_once()
+    query = recorder.async_add_executor_job.await_args.args[0]
+    assert query.func is history.get_significant_states
+    assert query.args[2] == query.args[1]
+    assert sorted(query.args[3]) == sorted(["person.tester_bob", TEST_PANEL])
+    assert uut.is_occupied() is True
+    assert uut.armed_state() == "armed_vacation"
+    assert hass.states.get("autoarm.restored_states").attributes["elapsed"] is not None
+
+    hass.states.async_set("person.tester_bob", "not_home")
+    assert uut.is_occupied() is False
+    uut.shutdown()
+
+
+async def test_restored_occupant_expires(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "unknown")
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    hass.config.components.add("recorder")
+    recorder = Mock()
+    recorder.async_add_executor_job = AsyncMock(return_value={"person.tester_bob": [State("person.tester_bob", "home")]})
+    clock = VirtualClock()
+    with patch("homeassistant.components.recorder.get_instance", return_value=recorder):
+        uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], restore_from_recorder=True, clock=clock)
+        await uut.initialize()
+    assert uut.is_occupied() is True
+
+    # tracker never recovers, so the restored state must not hold the house occupied
+    await clock.advance(RESTORE_TTL)
+    assert uut.restored_states == {}
+    assert uut.is_occupied() is False
+    assert uut.armed_state() == "armed_away"
+    uut.shutdown()
+
+
+def test_zombie_states():
+    assert is_zombie(None)
+    assert is_zombie("unavailable")
+    assert is_zombie("unknown")
+    assert not is_zombie("disarmed")
+
+
+async def test_panel_removed_is_dezombified(hass: HomeAssistant, autoarmer: AlarmArmer) -> None:
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "home")
+    hass.states.async_remove(TEST_PANEL)
+    await hass.async_block_till_done()
+    assert autoarmer.armed_state() == "armed_home"
+
+
+async def test_shadow_records_only_divergent_decisions(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "home")
+    hass.states.async_set(TEST_PANEL, "armed_home")
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], shadow={"auto_arm": False})
+    await uut.initialize()
+    assert uut.armed_state() == "disarmed"
+    await uut.reset_armed_state(force_arm=True)
+
+    report = await hass.services.async_call("autoarm", "shadow_report", {}, blocking=True, return_response=True)
+    assert report["evaluations"] == 2
+    assert report["divergence_count"] == 1
+    assert report["divergences"][0]["live"] == "disarmed"
+    assert report["divergences"][0]["shadow"] == "armed_home"
+    shadow_entity = hass.states.get("autoarm.shadow")
+    assert shadow_entity.state == "1"
+    assert shadow_entity.attributes["latest"]["shadow"] == "armed_home"
+    assert "divergences" not in shadow_entity.attributes
+    uut.shutdown()
+    assert not hass.services.has_service("autoarm", "shadow_report")
+
+
+async def test_shadow_published_before_any_divergence(hass: HomeAssistant):
+    hass.states.async_set("sun.sun", "above_horizon")
+    hass.states.async_set("person.tester_bob", "home")
+    hass.states.async_set(TEST_PANEL, "disarmed")
+    uut = AlarmArmer(hass, TEST_PANEL, occupants=["person.tester_bob"], shadow={"auto_arm": True})
+    uut.initialize_integration()
+    assert hass.states.get("autoarm.shadow").attributes["evaluations"] == 0
+
+    await uut.reset_armed_state(force_arm=True)
+    shadow_entity = hass.states.get("autoarm.shadow")
+    assert shadow_entity.state == "0"
+    assert shadow_entity.attributes["evaluations"] == 1
+    assert shadow_entity.attributes["latest"] is None
+    uut.shutdown()
@@ -0,0 +1,51 @@
+import datetime
+
+from custom_components.autoarm.autoarming import CircuitBreaker
+from custom_components.autoarm.clock import VirtualClock
+
+
+def test_opens_after_repeated_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.stats()["skipped"] == 1
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success(0.5)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.stats()["mean_latency"] == 0.5
+
+
+def test_allows_single_trial_after_cooldown():
+    clock = VirtualClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.tick(clock.now() + datetime.timedelta(seconds=60))
+    assert breaker.allow()
+    # half open, so concurrent calls are skipped while the trial is in flight
+    assert not breaker.allow()
+    assert breaker.is_open()
+
+
+def test_failed_trial_reopens():
+    clock = VirtualClock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.tick(clock.now() + datetime.timedelta(seconds=60))
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.tick(clock.now() + datetime.timedelta(seconds=60))
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.allow()
+    assert breaker.allow()
+    assert not breaker.is_open()
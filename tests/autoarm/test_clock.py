@@ -0,0 +1,75 @@
+import asyncio
+import datetime
+
+import homeassistant.util.dt as dt_util
+import pytest
+
+from custom_components.autoarm.clock import VirtualClock
+
+START = datetime.datetime(2024, 1, 5, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+async def test_fires_due_timers_in_order():
+    clock = VirtualClock(START)
+    fired = []
+    clock.call_later(30, lambda: fired.append(("late", clock.now())))
+    clock.call_later(10, lambda: fired.append(("early", clock.now())))
+    clock.call_later(90, lambda: fired.append(("never", clock.now())))
+    await clock.advance(60)
+    assert fired == [
+        ("early", START + datetime.timedelta(seconds=10)),
+        ("late", START + datetime.timedelta(seconds=30)),
+    ]
+    assert clock.now() == START + datetime.timedelta(seconds=60)
+
+
+async def test_awaits_async_timers_and_cancels():
+    clock = VirtualClock(START)
+    fired = []
+
+    async def action():
+        fired.append(clock.time())
+
+    cancel = clock.call_later(5, action)
+    clock.call_later(5, action)
+    cancel()
+    await clock.advance(5)
+    assert fired == [START.timestamp() + 5]
+
+
+async def test_daily_timer_repeats():
+    clock = VirtualClock(START)
+    fired = []
+    clock.call_daily(datetime.time(22, 0), lambda: fired.append(clock.now()))
+    await clock.advance(3 * 86400)
+    assert fired == [START.replace(hour=22) + datetime.timedelta(days=d) for d in range(3)]
+
+
+async def test_now_is_local_time():
+    clock = VirtualClock(START)
+    assert clock.now() == START
+    assert clock.now().utcoffset() == dt_util.as_local(START).utcoffset()
+
+
+async def test_sunrise_and_sunset_at_fixed_times():
+    clock = VirtualClock(START, sunrise=datetime.time(7, 30), sunset=datetime.time(16, 15))
+    fired = []
+    clock.call_at_sunset(lambda: fired.append(("sunset", clock.now())))
+    clock.call_at_sunrise(lambda: fired.append(("sunrise", clock.now())))
+    await clock.advance(86400)
+    assert fired == [
+        ("sunset", START.replace(hour=16, minute=15)),
+        ("sunrise", START.replace(hour=7, minute=30) + datetime.timedelta(days=1)),
+    ]
+
+
+async def test_wait_for_times_out_in_virtual_time():
+    clock = VirtualClock(START)
+    never = asyncio.get_running_loop().create_future()
+    waiting = asyncio.ensure_future(clock.wait_for(never, 10))
+    await asyncio.sleep(0)
+    await clock.advance(9)
+    assert not waiting.done()
+    await clock.advance(1)
+    with pytest.raises(asyncio.TimeoutError):
+        await waiting
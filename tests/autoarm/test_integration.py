@@ -1,4 +1,6 @@
 
+import pytest
+import voluptuous as vol
 from homeassistant.const import CONF_ICON
 from homeassistant.core import HomeAssistant
 from homeassistant.setup import async_setup_component
@@ -19,6 +21,7 @@ from custom_components.autoarm.const import (
     CONF_SLEEP_START,
     CONF_SUNRISE_CUTOFF,
     CONF_TITLE,
+    CONFIG_SCHEMA,
     DOMAIN,
 )
 
@@ -96,3 +99,12 @@ async def test_disarm_on_mobile_action(hass: HomeAssistant) -> None:
     hass.bus.async_fire("mobile_app_notification_action", {"action": "ALARM_PANEL_DISARM"})
     await hass.async_block_till_done()
     assert hass.states.get("alarm_panel.testing").state == "disarmed"
+
+
+def test_timeouts_must_be_positive() -> None:
+    base = {CONF_ALARM_PANEL: "alarm_panel.testing"}
+    assert CONFIG_SCHEMA({DOMAIN: dict(base, arm_timeout=2.5)})[DOMAIN]["arm_timeout"] == 2.5
+    with pytest.raises(vol.Invalid):
+        CONFIG_SCHEMA({DOMAIN: dict(base, arm_timeout=0)})
+    with pytest.raises(vol.Invalid):
+        CONFIG_SCHEMA({DOMAIN: dict(base, notify={"common": {"targets": [{"service": "notify.slow", "timeout": 0}]}})})
@@ -1,6 +1,5 @@
-import time
-
 from custom_components.autoarm.autoarming import Limiter
+from custom_components.autoarm.clock import VirtualClock
 
 
 def test_first_call_doesnt_trigger():
@@ -14,11 +13,12 @@ def test_multiple_calls_trigger():
     assert not limiter.triggered()
     assert limiter.triggered()
 
-def test_window_works_trigger():
-    limiter = Limiter(3, max_calls=2)
+async def test_window_works_trigger():
+    clock = VirtualClock()
+    limiter = Limiter(3, max_calls=2, clock=clock)
     assert not limiter.triggered()
     assert not limiter.triggered()
     assert limiter.triggered()
-    time.sleep(4)
+    await clock.advance(4)
     assert not limiter.triggered()
     assert len(limiter.calls) == 1
\ No newline at end of file
@@ -0,0 +1,100 @@
+import datetime
+import json
+
+import homeassistant.util.dt as dt_util
+
+from custom_components.autoarm.sweep import Replay, expand_grid, main, rank, sweep
+
+BASE = {"alarm_panel": "alarm_panel.testing", "occupants": ["person.tester_bob"], "auto_arm": True}
+
+
+def at(minutes: int) -> datetime.datetime:
+    return datetime.datetime(2024, 1, 5, 12, 0, tzinfo=datetime.timezone.utc) + datetime.timedelta(minutes=minutes)
+
+
+def test_expand_grid_validates_candidates():
+    candidates, rejected = expand_grid(BASE, {"throttle_calls": [4, 6], "sleep_start": ["21:00:00", "not a time"]})
+    assert len(candidates) == 2
+    assert len(rejected) == 2
+    assert candidates[0]["config"]["sleep_start"] == datetime.time(21, 0)
+
+
+def test_replay_arms_away_when_unoccupied():
+    config = expand_grid(BASE, {})[0][0]["config"]
+    replay = Replay(config)
+    metrics = replay.run(
+        [
+            (at(0), "sun.sun", "above_horizon"),
+            (at(0), "person.tester_bob", "home"),
+            (at(10), "person.tester_bob", "not_home"),
+            (at(20), "person.tester_bob", "home"),
+        ]
+    )
+    assert replay.states["alarm_panel.testing"] == "armed_away"
+    assert metrics["state_changes"] == 1
+    assert metrics["disarmed_unoccupied_secs"] == 0
+    assert metrics["armed_away_occupied_secs"] == 0
+
+
+def test_replay_counts_rate_limit_hits():
+    config = expand_grid(dict(BASE, disarm_button="binary_sensor.button"), {"throttle_calls": [1]})[0][0]["config"]
+    history = [(at(0), "binary_sensor.button", "on" if i % 2 else "off") for i in range(4)]
+    metrics = Replay(config).run(history)
+    assert metrics["rate_limit_hits"] == 3
+
+
+def test_rank_orders_by_metrics():
+    results = [
+        {"params": {"a": 1}, "metrics": {"disarmed_unoccupied_secs": 5, "state_changes": 1}},
+        {"params": {"a": 2}, "metrics": {"disarmed_unoccupied_secs": 0, "state_changes": 9}},
+    ]
+    assert [r["params"]["a"] for r in rank(results, ["disarmed_unoccupied_secs", "state_changes"])] == [2, 1]
+
+
+# sunrise at 05:30 UTC is 06:30 in Oslo, so after a 06:00 cutoff there, but before it in UTC
+SUNRISE_HISTORY = [
+    {"time": "2024-01-05T00:00:00+00:00", "entity_id": "person.tester_bob", "state": "home"},
+    {"time": "2024-01-05T00:00:00+00:00", "entity_id": "sun.sun", "state": "below_horizon"},
+    {"time": "2024-01-05T05:30:00+00:00", "entity_id": "sun.sun", "state": "above_horizon"},
+]
+
+
+def write_history(tmp_path) -> str:
+    path = tmp_path / "history.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in SUNRISE_HISTORY))
+    return str(path)
+
+
+def replay_in(time_zone: str, config: dict) -> Replay:
+    original = dt_util.DEFAULT_TIME_ZONE
+    dt_util.set_default_time_zone(dt_util.get_time_zone(time_zone))
+    try:
+        replay = Replay(config)
+        replay.run([(datetime.datetime.fromisoformat(r["time"]), r["entity_id"], r["state"]) for r in SUNRISE_HISTORY])
+        return replay
+    finally:
+        dt_util.set_default_time_zone(original)
+
+
+def test_replay_judges_sunrise_cutoff_in_local_time():
+    config = expand_grid(dict(BASE, sunrise_cutoff="06:00:00"), {})[0][0]["config"]
+    assert replay_in("UTC", config).states["alarm_panel.testing"] == "armed_night"
+    assert replay_in("Europe/Oslo", config).states["alarm_panel.testing"] == "disarmed"
+
+
+def test_sweep_across_worker_processes(tmp_path):
+    candidates, _ = expand_grid(BASE, {"sunrise_cutoff": ["06:00:00", "07:00:00"]})
+    results = sweep(write_history(tmp_path), candidates, workers=2, time_zone="Europe/Oslo")
+    assert [r["params"] for r in results] == [c["params"] for c in candidates]
+    assert [r["metrics"] for r in results] == [replay_in("Europe/Oslo", c["config"]).metrics for c in candidates]
+    assert [r["metrics"]["state_changes"] for r in results] == [2, 1]
+
+
+def test_main_prints_ranked_candidates(tmp_path, capsys):
+    grid = tmp_path / "grid.yaml"
+    grid.write_text(json.dumps({"base": BASE, "grid": {"sunrise_cutoff": ["06:00:00", "07:00:00"]}}))
+    argv = [write_history(tmp_path), str(grid), "--workers", "2", "--time-zone", "Europe/Oslo", "--top", "1"]
+    assert main([*argv, "--rank-by", "state_changes"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["params"] == {"sunrise_cutoff": "07:00:00"}